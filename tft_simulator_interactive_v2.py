@@ -5,9 +5,21 @@ Simula un display TFT su PC con finestra interattiva
 """
 
 import re
+import ast
 import pygame
 import sys
-from typing import Tuple
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import stat
+import struct
+import threading
+import zlib
+import numpy as np
+from functools import lru_cache
+from typing import Optional, Tuple
 
 # Colori TFT_eSPI
 TFT_COLORS = {
@@ -33,6 +45,756 @@ TFT_COLORS = {
     'TFT_BROWN': (150, 75, 0),
 }
 
+# ===== ANTI-ALIASING =====
+
+# Tabelle seno/coseno per gradi interi. Convenzione TFT_eSPI per gli archi:
+# 0° in basso (ore 6), angoli crescenti in senso orario.
+SIN_TABLE = np.sin(np.radians(np.arange(360)))
+COS_TABLE = np.cos(np.radians(np.arange(360)))
+
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    """Protegge gli array condivisi dalle cache"""
+    array.flags.writeable = False
+    return array
+
+
+def _pack_mask(coverage: np.ndarray, ox: int, oy: int):
+    """
+    Converte una copertura 0-1 in maschera uint8 ritagliata sui pixel visibili
+    
+    Returns:
+        (maschera, offset_x, offset_y) con gli offset del pixel [0, 0]
+    """
+    rows = np.flatnonzero(coverage.any(axis=1))
+    cols = np.flatnonzero(coverage.any(axis=0))
+    if not len(rows):
+        return _readonly(np.zeros((0, 0), dtype=np.uint8)), ox, oy
+    coverage = coverage[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    mask = (coverage * 255 + 0.5).astype(np.uint8)
+    return _readonly(mask), ox + int(cols[0]), oy + int(rows[0])
+
+
+@lru_cache(maxsize=8)
+def _polar_grid(window: Tuple[int, int, int, int]):
+    """
+    Griglia (dx, dy, distanza, angolo) sugli offset x0..x1, y0..y1 dal centro
+    
+    window è il risultato di _circle_window: al massimo il cerchio più un
+    pixel per lato (per il bordo anti-aliasing), ritagliato sullo schermo.
+    """
+    x0, y0, x1, y1 = window
+    dy, dx = np.mgrid[y0:y1 + 1, x0:x1 + 1].astype(np.float32)
+    dist = np.hypot(dx, dy)
+    angle = np.degrees(np.arctan2(-dx, dy)) % 360
+    return tuple(_readonly(a) for a in (dx, dy, dist, angle))
+
+
+def _circle_window(cx: int, cy: int, r: int, width: int, height: int):
+    """
+    Offset dal centro (x0, y0, x1, y1) della parte visibile di un cerchio
+    
+    Un cerchio interamente visibile dà sempre la stessa finestra, quindi
+    le sue maschere restano in cache qualunque sia la posizione.
+    
+    Returns:
+        La finestra, oppure None se il cerchio è fuori dallo schermo
+    """
+    size = r + 1
+    window = (max(-size, -cx), max(-size, -cy), min(size, width - 1 - cx), min(size, height - 1 - cy))
+    if window[0] > window[2] or window[1] > window[3]:
+        return None
+    return window
+
+
+@lru_cache(maxsize=512)
+def _arc_mask(r: int, ir: int, start: int, end: int,
+              smooth: bool, smooth_ends: bool, round_ends: bool,
+              window: Tuple[int, int, int, int]):
+    """
+    Maschera di copertura di un arco tra i raggi ir e r
+    
+    Gli archi ridisegnati ad ogni frame (gauge animati) la riutilizzano
+    dalla cache invece di ricalcolarla. La copertura è calcolata solo
+    nella finestra visibile (vedi _circle_window).
+    
+    Returns:
+        (maschera, offset_x, offset_y) rispetto al centro dell'arco
+    """
+    dx, dy, dist, angle = _polar_grid(window)
+    
+    # Distanza (in pixel) dal bordo dell'anello: positiva all'interno
+    signed = np.minimum(r + 0.5 - dist, dist - ir + 0.5)
+    
+    span = (end - start) % 360 or 360
+    if span < 360:
+        rel = (angle - start) % 360
+        inside = rel <= span
+        edge_deg = np.where(inside, np.minimum(rel, span - rel),
+                            -np.minimum(rel - span, 360 - rel))
+        # Distanza perpendicolare dal raggio che delimita l'estremità
+        edge = dist * np.sin(np.radians(np.clip(edge_deg, -90, 90)))
+        if not smooth_ends:
+            edge = np.where(edge >= 0, np.inf, -np.inf)
+        signed = np.minimum(signed, edge)
+        
+        if round_ends:
+            cap_r = (r - ir + 1) / 2
+            mid_r = (r + ir) / 2
+            for a in (start % 360, end % 360):
+                cx, cy = -mid_r * SIN_TABLE[a], mid_r * COS_TABLE[a]
+                signed = np.maximum(signed, cap_r - np.hypot(dx - cx, dy - cy))
+    
+    coverage = np.clip(signed + 0.5, 0.0, 1.0)
+    if not smooth:
+        coverage = (coverage >= 0.5).astype(np.float32)
+    return _pack_mask(coverage, window[0], window[1])
+
+
+@lru_cache(maxsize=64)
+def _disc_mask(r: int, window: Tuple[int, int, int, int]):
+    """Maschera di copertura di un cerchio pieno di raggio r (offset dal centro)"""
+    dist = _polar_grid(window)[2]
+    return _pack_mask(np.clip(r + 0.5 - dist, 0.0, 1.0), window[0], window[1])
+
+
+def _round_box_sdf(px, py, half_w, half_h, radius):
+    """Distanza con segno da un rettangolo arrotondato centrato nell'origine"""
+    qx = np.abs(px) - (half_w - radius)
+    qy = np.abs(py) - (half_h - radius)
+    outside = np.hypot(np.maximum(qx, 0), np.maximum(qy, 0))
+    return outside + np.minimum(np.maximum(qx, qy), 0) - radius
+
+
+@lru_cache(maxsize=128)
+def _round_rect_mask(r: int, ir: int, w: int, h: int, quadrants: int = 0xF):
+    """
+    Maschera di copertura del bordo di un rettangolo arrotondato w x h (offset dall'angolo)
+    
+    quadrants seleziona gli angoli come in TFT_eSPI (1 = alto-sx, 2 = alto-dx,
+    4 = basso-dx, 8 = basso-sx); un lato è tracciato se almeno uno dei suoi angoli lo è.
+    """
+    py, px = np.mgrid[0:h, 0:w].astype(np.float32)
+    px -= (w - 1) / 2
+    py -= (h - 1) / 2
+    
+    # Stessi centri degli angoli per bordo esterno e interno (spessore r - ir + 1)
+    outer_r = r + 0.5
+    inner_r = max(ir - 0.5, 0.0)
+    inset = outer_r - inner_r
+    signed = -_round_box_sdf(px, py, w / 2, h / 2, outer_r)
+    if w / 2 - inset > 0 and h / 2 - inset > 0:
+        signed = np.minimum(signed, _round_box_sdf(px, py, w / 2 - inset, h / 2 - inset, inner_r))
+    coverage = np.clip(signed + 0.5, 0.0, 1.0)
+    
+    quadrants &= 0xF
+    if quadrants != 0xF:
+        # Griglia 3x3: celle d'angolo di lato r + 1, lati nel mezzo
+        cell = r + 1
+        cols = np.arange(w)
+        rows = np.arange(h)[:, None]
+        left, right = cols < cell, cols >= w - cell
+        top, bottom = rows < cell, rows >= h - cell
+        mid_x, mid_y = ~(left | right), ~(top | bottom)
+        keep = mid_x & mid_y
+        for bit, sel_x, sel_y in ((0x1, left, top), (0x2, right, top),
+                                  (0x4, right, bottom), (0x8, left, bottom)):
+            if quadrants & bit:
+                keep = keep | (sel_x & sel_y)
+        for bits, sel_x, sel_y in ((0x3, mid_x, top), (0x6, right, mid_y),
+                                   (0xC, mid_x, bottom), (0x9, left, mid_y)):
+            if quadrants & bits:
+                keep = keep | (sel_x & sel_y)
+        coverage = np.where(keep, coverage, 0.0)
+    return _pack_mask(coverage, 0, 0)
+
+
+@lru_cache(maxsize=256)
+def _wide_line_mask(dx: int, dy: int, wd: int):
+    """
+    Maschera di copertura di una linea spessa con estremità arrotondate
+    
+    Returns:
+        (maschera, offset_x, offset_y) rispetto al primo estremo
+    """
+    half = wd / 2
+    pad = int(np.ceil(half)) + 1
+    ox, oy = min(0, dx) - pad, min(0, dy) - pad
+    py, px = np.mgrid[oy:max(0, dy) + pad + 1, ox:max(0, dx) + pad + 1].astype(np.float32)
+    
+    length_sq = dx * dx + dy * dy
+    if length_sq:
+        t = np.clip((px * dx + py * dy) / length_sq, 0.0, 1.0)
+    else:
+        t = 0.0
+    dist = np.hypot(px - t * dx, py - t * dy)
+    return _pack_mask(np.clip(half - dist + 0.5, 0.0, 1.0), ox, oy)
+
+
+# ===== SKETCH COMPILER =====
+
+# Stringhe/caratteri letterali oppure identificatori (non preceduti da '.')
+_TOKEN_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|(?<![.\w])[A-Za-z_]\w*')
+_STRING_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+_TYPE_PATTERN = (r'(?:unsigned\s+|signed\s+)?(?:int|long|short|float|double|bool|byte|char|'
+                 r'uint8_t|uint16_t|uint32_t|int8_t|int16_t|int32_t|size_t)')
+_DECL_RE = re.compile(r'(const\s+)?(?:static\s+)?(' + _TYPE_PATTERN + r')\s+(\w+)\s*(?:=\s*(.+))?$', re.DOTALL)
+_CALL_RE = re.compile(r'(?:(\w+)\s*\.\s*)?(\w+)\s*\((.*)\)$', re.DOTALL)
+_FUNC_RE = re.compile(r'(?:static\s+|inline\s+)*[\w\s\*&]*?\b(\w+)\s*\(([^()]*)\)\s*$', re.DOTALL)
+_FOR_RE = re.compile(r'for\s*\(\s*(?:int\s+)?(\w+)\s*=\s*([^;]+);\s*\1\s*(<=|<|>=|>)\s*([^;]+);\s*(.+)\)$',
+                     re.DOTALL)
+_KEYWORD_RE = re.compile(r'(for|if|while|switch|else|do)\b')
+_CONTROL_KEYWORDS = {'for', 'if', 'while', 'switch'}
+
+def _cdiv(a, b):
+    """Divisione come in C: tra interi tronca verso zero"""
+    if isinstance(a, int) and isinstance(b, int):
+        quotient = abs(a) // abs(b)
+        return quotient if (a < 0) == (b < 0) else -quotient
+    return a / b
+
+
+# Nomi visibili nelle espressioni oltre alle variabili dello sketch
+_SKETCH_NAMES = dict(TFT_COLORS, abs=abs, min=min, max=max, _cdiv=_cdiv)
+
+# Sintassi C tradotta in Python (fuori dalle stringhe)
+_C_SYNTAX = [
+    (re.compile(r'&&'), ' and '),
+    (re.compile(r'\|\|'), ' or '),
+    (re.compile(r'!(?!=)'), ' not '),
+    (re.compile(r'\btrue\b'), 'True'),
+    (re.compile(r'\bfalse\b'), 'False'),
+    (re.compile(r'\(\s*' + _TYPE_PATTERN + r'\s*\)'), ''),  # cast
+    (re.compile(r'(\d+\.\d*|\.\d+)[fF]\b'), r'\1'),         # 1.5f
+]
+
+# Primitive chiamabili dagli sketch: {nome: (metodo, tipi argomenti, default finali)}
+# Tipi: i intero, c colore, b sfondo (0x00FFFFFF = schermo), f booleano, s testo,
+# n nome della bitmap. I default completano gli ultimi argomenti omessi.
+_PRIMITIVES = {
+    'setRotation': ('setRotation', 'i', ()),
+    'fillScreen': ('fillScreen', 'c', ()),
+    'drawRect': ('drawRect', 'iiiic', ()),
+    'fillRect': ('fillRect', 'iiiic', ()),
+    'drawRoundRect': ('drawRoundRect', 'iiiiic', ()),
+    'fillRoundRect': ('fillRoundRect', 'iiiiic', ()),
+    'drawCircle': ('drawCircle', 'iiic', ()),
+    'fillCircle': ('fillCircle', 'iiic', ()),
+    'drawLine': ('drawLine', 'iiiic', ()),
+    'drawTriangle': ('drawTriangle', 'iiiiiic', ()),
+    'fillTriangle': ('fillTriangle', 'iiiiiic', ()),
+    'drawArc': ('drawArc', 'iiiiiicbf', (True,)),
+    'drawSmoothArc': ('drawSmoothArc', 'iiiiiicbf', (False,)),
+    'drawWideLine': ('drawWideLine', 'iiiiicb', (None,)),
+    'fillSmoothCircle': ('fillSmoothCircle', 'iiicb', (None,)),
+    'drawSmoothRoundRect': ('drawSmoothRoundRect', 'iiiiiicbi', (None, 0xF)),
+    'drawBitmap': ('drawBitmap', 'iiniic', ()),
+    'setCursor': ('setCursor', 'iii', (None,)),
+    'setTextColor': ('setTextColor', 'c', ()),
+    'setTextFont': ('setTextFont', 'i', ()),
+    'setTextSize': ('setTextSize', 'i', ()),
+    'print': ('print_text', 's', ()),
+    'println': ('println_text', 's', ('',)),
+    'drawString': ('drawString', 'siii', (None,)),
+}
+
+
+def _find_closing(text: str, start: int) -> int:
+    """Indice della parentesi che chiude quella in text[start] (-1 se manca)"""
+    depth = 0
+    quote = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == '\\':
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '({':
+            depth += 1
+        elif ch in ')}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+
+def _split_args(text: str) -> list:
+    """Divide gli argomenti di una chiamata sulle virgole di primo livello"""
+    args = []
+    depth = 0
+    quote = None
+    current = []
+    for ch in text:
+        if quote:
+            if ch == quote and (not current or current[-1] != '\\'):
+                quote = None
+        elif ch in '"\'':
+            quote = ch
+        elif ch in '({[':
+            depth += 1
+        elif ch in ')}]':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            args.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    if ''.join(current).strip() or args:
+        args.append(''.join(current).strip())
+    return args
+
+
+def _strip_comments(code: str) -> str:
+    """Rimuove i commenti // e /* */ preservando le stringhe"""
+    def replace(match):
+        text = match.group(0)
+        return text if text[0] in '"\'' else ('\n' * text.count('\n') or ' ')
+    return re.sub(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/',
+                  replace, code, flags=re.DOTALL)
+
+
+def _python_expr(text: str) -> str:
+    """Traduce un'espressione C in sintassi Python lasciando invariate le stringhe"""
+    parts = _STRING_RE.split(text.strip())
+    for i in range(0, len(parts), 2):
+        for pattern, replacement in _C_SYNTAX:
+            parts[i] = pattern.sub(replacement, parts[i])
+    return ''.join(parts).strip()
+
+
+class _CDivision(ast.NodeTransformer):
+    """Sostituisce a / b con _cdiv(a, b)"""
+    
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Div):
+            call = ast.Call(func=ast.Name(id='_cdiv', ctx=ast.Load()),
+                            args=[node.left, node.right], keywords=[])
+            return ast.copy_location(call, node)
+        return node
+
+
+@lru_cache(maxsize=1024)
+def _compile_expr(text: str):
+    """
+    Compila un'espressione C in un code object Python
+    
+    Il risultato va valutato con le variabili dello sketch (vedi
+    TFTSimulator.eval_expr); None se l'espressione non è traducibile.
+    """
+    try:
+        tree = _CDivision().visit(ast.parse(_python_expr(text), mode='eval'))
+        return compile(ast.fix_missing_locations(tree), '<sketch>', 'eval')
+    except (SyntaxError, ValueError):
+        return None
+
+
+def _slot_template(text: str, params: list) -> str:
+    """
+    Converte il corpo di una macro in un template str.format con uno slot per parametro
+    
+    Gli identificatori uguali a un parametro diventano {indice}; stringhe
+    e membri (es. tft.width) restano invariati.
+    """
+    index = {name: i for i, name in enumerate(params)}
+    parts = []
+    pos = 0
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group(0)
+        parts.append(text[pos:match.start()].replace('{', '{{').replace('}', '}}'))
+        if token in index:
+            parts.append('{%d}' % index[token])
+        else:
+            parts.append(token.replace('{', '{{').replace('}', '}}'))
+        pos = match.end()
+    parts.append(text[pos:].replace('{', '{{').replace('}', '}}'))
+    return ''.join(parts)
+
+
+def _expand_macros(text: str, macros: dict, depth: int = 0) -> str:
+    """Espande le macro #define (anche con argomenti) fuori dalle stringhe, senza aggiungere parentesi"""
+    if not macros or depth > 16:
+        return text
+    result = []
+    pos = 0
+    changed = False
+    while True:
+        match = _TOKEN_RE.search(text, pos)
+        if match is None:
+            break
+        token = match.group(0)
+        result.append(text[pos:match.start()])
+        pos = match.end()
+        macro = macros.get(token)
+        if macro is None:
+            result.append(token)
+            continue
+        params, body = macro
+        if params is None:
+            result.append(body)
+            changed = True
+            continue
+        # Macro con argomenti: serve una chiamata NOME(...)
+        call_start = pos
+        while call_start < len(text) and text[call_start].isspace():
+            call_start += 1
+        close = _find_closing(text, call_start) if text[call_start:call_start + 1] == '(' else -1
+        args = _split_args(text[call_start + 1:close]) if close >= 0 else None
+        if args is None or len(args) != len(params):
+            result.append(token)
+            continue
+        result.append(body.format(*args))
+        pos = close + 1
+        changed = True
+    result.append(text[pos:])
+    expanded = ''.join(result)
+    return _expand_macros(expanded, macros, depth + 1) if changed else expanded
+
+
+class CompiledFunction:
+    """
+    Funzione dello sketch compilata una sola volta
+    
+    Il corpo è una lista di statement con le espressioni già compilate in
+    code object e le primitive già risolte: ad ogni chiamata si valutano
+    solo le espressioni, con i parametri come variabili locali.
+    """
+    
+    def __init__(self, name: str, params: list, defaults: list, body: list):
+        self.name = name
+        self.params = params        # Nomi dei parametri
+        self.defaults = defaults    # Espressioni di default compilate (None se obbligatorio)
+        self.body = body            # Statement compilati (vedi _compile_block)
+
+
+class CompiledSketch:
+    """Funzioni, macro e variabili globali estratte da uno sketch"""
+    
+    def __init__(self, functions: dict, macros: dict, globals_: list, warnings: list):
+        self.functions = functions  # {nome: CompiledFunction}
+        self.macros = macros        # {nome: (parametri o None, corpo)}
+        self.globals = globals_     # [(nome, espressione compilata, intera)] in ordine di dichiarazione
+        self.warnings = warnings    # Costrutti non supportati, mostrati ad ogni esecuzione
+
+
+def _compile_checked(text: str, warnings: list):
+    """Compila un'espressione annotando quelle non traducibili"""
+    code = _compile_expr(text)
+    if code is None:
+        warnings.append(f"Espressione non supportata: {text}")
+    return code
+
+
+def _is_integral(ctype: str) -> bool:
+    """True se il tipo C tronca i valori a intero"""
+    return 'float' not in ctype and 'double' not in ctype
+
+
+def _compile_command(obj: Optional[str], name: str, arg_text: str, warnings: list):
+    """
+    Risolve la chiamata a una primitiva TFT e compila i suoi argomenti
+    
+    Returns:
+        ('draw', metodo, nome, [(tipo, code object, testo)]) oppure None se
+        la chiamata non disegna (es. Serial.begin, delay, tft.init)
+    """
+    spec = _PRIMITIVES.get(name)
+    if spec is None or obj is None or (name in ('print', 'println') and obj != 'tft'):
+        return None
+    method, kinds, defaults = spec
+    args = _split_args(arg_text)
+    required = len(kinds) - len(defaults)
+    if len(args) < required:
+        warnings.append(f"{obj}.{name}(): attesi almeno {required} argomenti, ricevuti {len(args)}")
+        return None
+    
+    # Gli argomenti costanti usano il tipo '=' con il valore al posto del code
+    # object (testo None per i default omessi)
+    compiled = []
+    for i, kind in enumerate(kinds):
+        if i >= len(args):
+            compiled.append(('=', defaults[i - required], None))
+        elif kind == 'n':
+            compiled.append(('=', args[i], args[i]))
+        elif kind == 'b' and args[i].upper() == '0X00FFFFFF':
+            compiled.append(('=', None, args[i]))
+        else:
+            compiled.append((kind, _compile_checked(args[i], warnings), args[i]))
+    return ('draw', method, name, compiled)
+
+
+def _compile_statement(text: str, function_names: set, warnings: list):
+    """Compila un singolo statement terminato da ';' (None se non ha effetto)"""
+    if re.match(r'return\b', text):
+        return ('return',)
+    
+    # ('let', nome, espressione, locale, intera): le dichiarazioni creano una
+    # variabile locale, le assegnazioni scrivono sulla locale o sulla globale
+    decl = _DECL_RE.match(text)
+    if decl:
+        _, ctype, name, expr = decl.groups()
+        return ('let', name, _compile_checked(expr or '0', warnings), True, _is_integral(ctype))
+    assign = re.match(r'(\w+)\s*(=|\+=|-=|\*=|/=)\s*(.+)$', text, re.DOTALL)
+    if assign:
+        name, op, expr = assign.groups()
+        if op != '=':
+            expr = f"{name} {op[0]} ({expr})"
+        return ('let', name, _compile_checked(expr, warnings), False, None)
+    step = re.match(r'(?:(\w+)\s*(\+\+|--)|(\+\+|--)\s*(\w+))$', text)
+    if step:
+        name = step.group(1) or step.group(4)
+        op = step.group(2) or step.group(3)
+        return ('let', name, _compile_expr(f"{name} {op[0]} 1"), False, None)
+    
+    call = _CALL_RE.match(text)
+    if call:
+        obj, name, args = call.groups()
+        if obj is None and name in function_names:
+            return ('call', name, [_compile_checked(arg, warnings) for arg in _split_args(args)])
+        return _compile_command(obj, name, args, warnings)
+    
+    warnings.append(f"Istruzione non supportata: {text}")
+    return None
+
+
+def _compile_for(header: str, body: list, warnings: list):
+    """Compila l'intestazione di un ciclo for"""
+    match = _FOR_RE.match(header)
+    if not match:
+        warnings.append(f"Ciclo for non supportato: {header}")
+        return None
+    var, start, cond, end, increment = (g.strip() for g in match.groups())
+    
+    # Solo incrementi costanti: i++, i--, i += n, i -= n, i = i + n, i = i - n
+    v = re.escape(var)
+    step = None
+    compound = re.fullmatch(rf'{v}\s*([+-])=\s*(.+)', increment, re.DOTALL)
+    long_form = re.fullmatch(rf'{v}\s*=\s*{v}\s*([+-])\s*(.+)', increment, re.DOTALL)
+    if re.fullmatch(rf'\+\+\s*{v}|{v}\s*\+\+', increment):
+        step = '1'
+    elif re.fullmatch(rf'--\s*{v}|{v}\s*--', increment):
+        step = '-1'
+    elif compound:
+        step = compound.group(2) if compound.group(1) == '+' else f"-({compound.group(2)})"
+    elif long_form:
+        # i = i - a + b: il segno si applica solo al primo operando, come in C
+        step = long_form.group(2) if long_form.group(1) == '+' else f"-{long_form.group(2)}"
+    if step is None:
+        warnings.append(f"Incremento del ciclo for non supportato, ciclo ignorato: {header}")
+        return None
+    
+    return ('for', var, _compile_checked(start, warnings), cond, _compile_checked(end, warnings),
+            _compile_checked(step, warnings), body)
+
+
+def _skip_blank(code: str, pos: int) -> int:
+    """Salta spazi e ';' vuoti"""
+    while pos < len(code) and (code[pos].isspace() or code[pos] == ';'):
+        pos += 1
+    return pos
+
+
+def _compile_block(code: str, function_names: set, warnings: list) -> list:
+    """Compila il corpo di una funzione (o di un blocco) in una lista di statement"""
+    statements = []
+    pos = _skip_blank(code, 0)
+    while pos < len(code):
+        compiled, pos = _compile_next(code, pos, function_names, warnings)
+        statements.extend(compiled)
+        pos = _skip_blank(code, pos)
+    return statements
+
+
+def _compile_next(code: str, pos: int, function_names: set, warnings: list):
+    """
+    Compila un solo statement (semplice, blocco {...} o struttura di controllo)
+    
+    Returns:
+        (lista di statement compilati, posizione dopo lo statement)
+    """
+    n = len(code)
+    pos = _skip_blank(code, pos)
+    if pos >= n:
+        return [], pos
+    
+    if code[pos] == '{':
+        close = _find_closing(code, pos)
+        close = n if close < 0 else close
+        return _compile_block(code[pos + 1:close], function_names, warnings), close + 1
+    
+    keyword = _KEYWORD_RE.match(code, pos)
+    if keyword:
+        word = keyword.group(1)
+        header_end = keyword.end()
+        condition = ''
+        if word in _CONTROL_KEYWORDS:
+            paren = code.find('(', header_end)
+            close = _find_closing(code, paren) if paren >= 0 else -1
+            if close < 0:
+                return [], n
+            condition = code[paren + 1:close].strip()
+            header_end = close + 1
+        
+        # Corpo vuoto (es. while (!Serial);) oppure lo statement successivo;
+        # i corpi che verranno saltati non producono avvisi
+        skipped = word in ('while', 'switch', 'do')
+        body_start = header_end
+        while body_start < n and code[body_start].isspace():
+            body_start += 1
+        empty = body_start < n and code[body_start] == ';'
+        if empty:
+            body, pos = [], body_start + 1
+        else:
+            body, pos = _compile_next(code, header_end, function_names, [] if skipped else warnings)
+        
+        if word == 'for':
+            loop = _compile_for(code[keyword.start():header_end], body, warnings)
+            return ([loop] if loop is not None else []), pos
+        if word == 'if':
+            else_body = []
+            else_match = _KEYWORD_RE.match(code, _skip_blank(code, pos))
+            if else_match and else_match.group(1) == 'else':
+                else_body, pos = _compile_next(code, else_match.end(), function_names, warnings)
+            return [('if', _compile_checked(condition, warnings), condition, body, else_body)], pos
+        if word == 'do':
+            # do { ... } while (...); : la condizione finale fa parte dello statement
+            tail = re.compile(r'\s*while\s*\(').match(code, pos)
+            close = _find_closing(code, tail.end() - 1) if tail else -1
+            if close >= 0:
+                pos = close + 1
+        if skipped:
+            # Cicli e switch non sono valutati: meglio saltarli che eseguirli una volta
+            if not empty:
+                warnings.append(f"{word} non supportato: corpo ignorato")
+            return [], pos
+        # else senza if: il corpo viene eseguito
+        return body, pos
+    
+    end = _statement_end(code, pos)
+    text = code[pos:end].strip()
+    compiled = _compile_statement(text, function_names, warnings) if text else None
+    return ([compiled] if compiled is not None else []), end + 1
+
+
+def _statement_end(code: str, start: int) -> int:
+    """Indice del ';' che chiude lo statement che inizia in start"""
+    i = start
+    while i < len(code):
+        ch = code[i]
+        if ch in '({':
+            close = _find_closing(code, i)
+            if close < 0:
+                return len(code)
+            i = close
+        elif ch in '"\'':
+            match = _TOKEN_RE.match(code, i)
+            if match:
+                i = match.end() - 1
+        elif ch == ';':
+            return i
+        i += 1
+    return len(code)
+
+
+@lru_cache(maxsize=16)
+def compile_sketch(code: str) -> CompiledSketch:
+    """
+    Estrae e compila #define, variabili globali e funzioni di uno sketch
+    
+    Il risultato è in cache per contenuto del sorgente: rieseguire lo
+    stesso file non ripete il parsing. Non stampa nulla: i costrutti non
+    supportati finiscono in CompiledSketch.warnings.
+    """
+    # === #define ===
+    macros = {}
+    lines = []
+    for line in _strip_comments(code).split('\n'):
+        define = re.match(r'\s*#\s*define\s+(\w+)(\(([^)]*)\))?\s*(.*)$', line)
+        if define:
+            name, _, params, body = define.groups()
+            if params is None:
+                macros[name] = (None, body.strip())
+            else:
+                names = [p.strip() for p in params.split(',') if p.strip()]
+                macros[name] = (names, _slot_template(body.strip(), names))
+            lines.append('')
+        elif line.lstrip().startswith('#'):
+            lines.append('')  # #include, #ifdef, ...
+        else:
+            lines.append(line)
+    source = '\n'.join(lines)
+    
+    # === Livello globale: funzioni e dichiarazioni ===
+    raw_functions = []
+    globals_ = []
+    warnings = []
+    pos = 0
+    while pos < len(source):
+        end = _statement_end(source, pos)
+        brace = source.find('{', pos, end)
+        if brace >= 0:
+            header = source[pos:brace].strip()
+            close = _find_closing(source, brace)
+            close = len(source) if close < 0 else close
+            func = _FUNC_RE.match(header)
+            if func and '=' not in header.split('(', 1)[0]:
+                raw_functions.append((func.group(1), func.group(2), source[brace + 1:close]))
+                pos = close + 1
+                continue
+            # Inizializzatore di array (es. bitmap PROGMEM): fino al ';'
+            end = _statement_end(source, close + 1)
+        
+        decl = _DECL_RE.match(source[pos:end].strip())
+        if decl:
+            is_const, ctype, name, expr = decl.groups()
+            expr = _expand_macros((expr or '0').strip(), macros)
+            if is_const:
+                # Le costanti si sostituiscono nel codice, tra parentesi come in C
+                macros[name] = (None, f"({expr})")
+            else:
+                # Le variabili sono valutate in ordine all'avvio (vedi parse_and_execute)
+                globals_.append((name, _compile_checked(expr, warnings), _is_integral(ctype)))
+        pos = end + 1
+    
+    # === Compilazione dei corpi, con le macro già espanse ===
+    function_names = {name for name, _, _ in raw_functions}
+    functions = {}
+    for name, param_text, body in raw_functions:
+        params = []
+        defaults = []
+        for param in _split_args(param_text):
+            if not param or param == 'void':
+                continue
+            decl, _, default = param.partition('=')
+            params.append(re.findall(r'\w+', decl)[-1])
+            defaults.append(_compile_checked(_expand_macros(default.strip(), macros), warnings)
+                            if default else None)
+        compiled = _compile_block(_expand_macros(body, macros), function_names, warnings)
+        functions[name] = CompiledFunction(name, params, defaults, compiled)
+    
+    return CompiledSketch(functions, macros, globals_, warnings)
+
+
+@lru_cache(maxsize=4096)
+def _compile_line(line: str, sketch: Optional[CompiledSketch]):
+    """
+    Compila una riga di comandi (es. da --ingest) con macro e funzioni dello sketch caricato
+    
+    Returns:
+        (statement compilati, avvisi)
+    """
+    macros = sketch.macros if sketch is not None else {}
+    function_names = set(sketch.functions) if sketch is not None else set()
+    warnings = []
+    statements = _compile_block(_expand_macros(line, macros), function_names, warnings)
+    return statements, warnings
+
+
 class TFTSimulator:
     def __init__(self, width=480, height=320):
         """Inizializza il simulatore"""
@@ -68,6 +830,18 @@ class TFTSimulator:
         # Bitmap storage per immagini monocromatiche
         self.bitmaps = {}  # {nome_array: (width, height, bytes_data)}
         
+        # Server di streaming opzionale (vedi FrameStreamer)
+        self.streamer = None
+        
+        # Log dei comandi eseguiti (disattivato in modalità ingestione)
+        self.verbose = True
+        
+        # Funzioni e variabili globali dello sketch (vedi compile_sketch)
+        self.sketch = None
+        self.functions = {}
+        self.global_vars = {'__builtins__': _SKETCH_NAMES}
+        self._call_depth = 0
+        
         pygame.init()
         self.update_display()
         pygame.display.set_caption("TFT_eSPI Simulator (Interactive)")
@@ -107,6 +881,22 @@ class TFTSimulator:
         
         return (255, 255, 255)
     
+    def parse_bg_color(self, color_str: Optional[str]) -> Optional[Tuple[int, int, int]]:
+        """
+        Colore di sfondo opzionale per le primitive anti-aliasing
+        
+        Restituisce None (sfuma con i pixel dello schermo) se il colore è
+        assente o vale 0x00FFFFFF, il valore di default di TFT_eSPI.
+        """
+        if color_str is None or color_str.strip().upper() == '0X00FFFFFF':
+            return None
+        return self.parse_color(color_str)
+    
+    def log(self, message: str):
+        """Stampa un messaggio se il log dei comandi è attivo"""
+        if self.verbose:
+            print(message)
+    
     def parse_value(self, value_str: str, variables: dict) -> int:
         """Valuta espressioni matematiche"""
         value_str = value_str.strip()
@@ -202,6 +992,141 @@ class TFTSimulator:
                         if 0 <= px < self.width and 0 <= py < self.height:
                             self.surface.set_at((px, py), color)
     
+    # ===== SMOOTH GRAPHICS (ANTI-ALIASING) =====
+    
+    def _blend_mask(self, mask: np.ndarray, x: int, y: int, fg_color: Tuple[int, int, int],
+                    bg_color: Optional[Tuple[int, int, int]] = None):
+        """
+        Compone una maschera di copertura sulla surface
+        
+        Args:
+            mask: Array uint8 (altezza, larghezza) con la copertura di ogni pixel (0-255)
+            x, y: Posizione del pixel [0, 0] della maschera
+            fg_color: Colore del primo piano
+            bg_color: Colore con cui sfumare i bordi (None = legge i pixel dello schermo)
+        """
+        mh, mw = mask.shape
+        sw, sh = self.surface.get_size()
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + mw, sw), min(y + mh, sh)
+        if x0 >= x1 or y0 >= y1:
+            return
+        
+        # surfarray è indicizzato [x, y]: la maschera va trasposta
+        alpha = mask[y0 - y:y1 - y, x0 - x:x1 - x].T
+        covered = alpha > 0
+        if not covered.any():
+            return
+        
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        region = pixels[x0:x1, y0:y1]
+        if bg_color is None:
+            base = region[covered].astype(np.float32)
+        else:
+            base = np.asarray(bg_color, dtype=np.float32)
+        fg = np.asarray(fg_color, dtype=np.float32)
+        a = alpha[covered][:, None] * np.float32(1 / 255)
+        region[covered] = (base + (fg - base) * a + 0.5).astype(np.uint8)
+        del pixels  # Sblocca la surface
+    
+    def drawArc(self, x: int, y: int, r: int, ir: int, start_angle: int, end_angle: int,
+                fg_color: Tuple[int, int, int], bg_color: Optional[Tuple[int, int, int]],
+                smooth: bool = True):
+        """
+        Arco tra i raggi ir e r (bordi anti-aliasing, estremità nette)
+        
+        Args:
+            x, y: Centro
+            r, ir: Raggio esterno e interno (spessore r - ir + 1)
+            start_angle, end_angle: Gradi 0-360, 0 in basso, senso orario
+            fg_color: Colore dell'arco
+            bg_color: Colore con cui sfumare i bordi (None = legge lo schermo)
+            smooth: False disattiva l'anti-aliasing
+        """
+        self._draw_arc(x, y, r, ir, start_angle, end_angle, fg_color, bg_color,
+                       smooth, smooth_ends=False, round_ends=False)
+    
+    def drawSmoothArc(self, x: int, y: int, r: int, ir: int, start_angle: int, end_angle: int,
+                      fg_color: Tuple[int, int, int], bg_color: Optional[Tuple[int, int, int]],
+                      round_ends: bool = False):
+        """
+        Arco con tutti i bordi anti-aliasing, estremità opzionalmente arrotondate
+        
+        Args: come drawArc, round_ends=True arrotonda le estremità
+        """
+        self._draw_arc(x, y, r, ir, start_angle, end_angle, fg_color, bg_color,
+                       True, smooth_ends=True, round_ends=round_ends)
+    
+    def _draw_arc(self, x, y, r, ir, start_angle, end_angle, fg_color, bg_color,
+                  smooth, smooth_ends, round_ends):
+        # Interi prima della cache: 30 e 30.0 sono la stessa maschera
+        x, y, r, ir = int(x), int(y), int(r), int(ir)
+        if r < ir:
+            r, ir = ir, r
+        if r <= 0 or ir < 0:
+            return
+        start_angle = int(min(max(start_angle, 0), 360))
+        end_angle = int(min(max(end_angle, 0), 360))
+        if start_angle == end_angle:
+            return
+        
+        window = _circle_window(x, y, r, *self.surface.get_size())
+        if window is None:
+            return
+        mask, ox, oy = _arc_mask(r, ir, start_angle, end_angle, smooth, smooth_ends, round_ends, window)
+        self._blend_mask(mask, x + ox, y + oy, fg_color, bg_color)
+    
+    def drawWideLine(self, x0: int, y0: int, x1: int, y1: int, wd: int,
+                     fg_color: Tuple[int, int, int], bg_color: Optional[Tuple[int, int, int]] = None):
+        """
+        Linea anti-aliasing di spessore wd con estremità arrotondate
+        
+        Args:
+            x0, y0, x1, y1: Estremi
+            wd: Spessore in pixel
+            fg_color: Colore della linea
+            bg_color: Colore con cui sfumare i bordi (None = legge lo schermo)
+        """
+        if wd <= 0:
+            return
+        mask, ox, oy = _wide_line_mask(x1 - x0, y1 - y0, wd)
+        self._blend_mask(mask, x0 + ox, y0 + oy, fg_color, bg_color)
+    
+    def fillSmoothCircle(self, x: int, y: int, r: int, color: Tuple[int, int, int],
+                         bg_color: Optional[Tuple[int, int, int]] = None):
+        """Cerchio pieno anti-aliasing (bg_color None = legge lo schermo)"""
+        x, y, r = int(x), int(y), int(r)
+        if r < 0:
+            return
+        window = _circle_window(x, y, r, *self.surface.get_size())
+        if window is None:
+            return
+        mask, ox, oy = _disc_mask(r, window)
+        self._blend_mask(mask, x + ox, y + oy, color, bg_color)
+    
+    def drawSmoothRoundRect(self, x: int, y: int, r: int, ir: int, w: int, h: int,
+                            fg_color: Tuple[int, int, int],
+                            bg_color: Optional[Tuple[int, int, int]] = None, quadrants: int = 0xF):
+        """
+        Bordo anti-aliasing di un rettangolo arrotondato
+        
+        Args:
+            x, y: Angolo top-left del rettangolo
+            r, ir: Raggio esterno e interno degli angoli (spessore r - ir + 1)
+            w, h: Larghezza e altezza complessive
+            fg_color: Colore del bordo
+            bg_color: Colore con cui sfumare i bordi (None = legge lo schermo)
+            quadrants: Angoli da tracciare (1 alto-sx, 2 alto-dx, 4 basso-dx, 8 basso-sx)
+        """
+        if r < ir:
+            r, ir = ir, r
+        if r <= 0 or ir < 0 or w <= 0 or h <= 0 or not quadrants & 0xF:
+            return
+        r = min(r, (min(w, h) - 1) // 2)
+        ir = min(ir, r)
+        mask, ox, oy = _round_rect_mask(r, ir, w, h, quadrants & 0xF)
+        self._blend_mask(mask, x + ox, y + oy, fg_color, bg_color)
+    
     # ===== TEXT SUPPORT =====
     
     def setCursor(self, x: int, y: int, font=None):
@@ -323,10 +1248,12 @@ class TFTSimulator:
                                          self.surface.get_height() * self.scale))
         self.screen.blit(scaled, (0, 0))
         pygame.display.flip()
+        
+        if self.streamer is not None:
+            self.streamer.publish(self.surface)
     
     def parse_and_execute(self, code: str):
         """Esegue codice Arduino"""
-        variables = {}
         
         # === PARSING BITMAP ARRAYS ===
         # Cerca array di bitmap tipo: const unsigned char nome[] PROGMEM = { ... };
@@ -353,129 +1280,184 @@ class TFTSimulator:
             self.width = self.default_width
             self.height = self.default_height
         
-        # Estrae variabili int
-        for match in re.finditer(r'int\s+(\w+)\s*=\s*([^;]+);', code):
-            var_name = match.group(1)
-            var_value = match.group(2)
-            try:
-                variables[var_name] = self.parse_value(var_value, variables)
-            except:
-                pass
+        # Compila funzioni, #define e globali (in cache per contenuto del file)
+        hits = compile_sketch.cache_info().hits
+        sketch = compile_sketch(code)
+        source = "cache" if compile_sketch.cache_info().hits > hits else "compilato"
+        print(f"✓ Sketch {source}: {len(sketch.functions)} funzioni, "
+              f"{len(sketch.macros)} macro/costanti")
+        for warning in sketch.warnings:
+            print(f"⚠️  {warning}")
+        
+        # Ogni globale vede quelle dichiarate prima di lei
+        self.sketch = sketch
+        self.functions = sketch.functions
+        self.global_vars = {'__builtins__': _SKETCH_NAMES}
+        for name, expr, integral in sketch.globals:
+            self.assign(self.global_vars, name, self.eval_expr(expr, {}), integral)
         
-        # Trova setup() con parsing corretto delle parentesi
-        setup_start = re.search(r'void\s+setup\s*\(\s*\)\s*{', code)
-        if not setup_start:
+        if 'setup' not in self.functions:
             print("⚠️  Funzione setup() non trovata")
             return
         
-        # Parsing parentesi bilanciate
-        start_pos = setup_start.end()
-        brace_count = 1
-        pos = start_pos
-        
-        while pos < len(code) and brace_count > 0:
-            if code[pos] == '{':
-                brace_count += 1
-            elif code[pos] == '}':
-                brace_count -= 1
-            pos += 1
+        self.call_function('setup', [])
         
-        setup_code = code[start_pos:pos-1]
-        
-        # Esegue comandi non-for
-        lines = setup_code.split('\n')
-        in_for = False
-        brace_count = 0
+        self.render()
+    
+    def call_function(self, name: str, values: list):
+        """
+        Chiama una funzione dello sketch
         
-        for line in lines:
-            stripped = line.strip()
-            
-            if 'for' in stripped and 'int' in stripped and '(' in stripped:
-                in_for = True
-                brace_count = 0
-            
-            if in_for:
-                brace_count += stripped.count('{') - stripped.count('}')
-                if brace_count <= 0 and '}' in stripped:
-                    in_for = False
-                continue
-            
-            if stripped and not stripped.startswith('//'):
-                self.execute_command(stripped, variables)
+        Args:
+            name: Nome della funzione (deve essere in self.functions)
+            values: Valori degli argomenti, già valutati dal chiamante
+        """
+        func = self.functions[name]
+        missing = func.defaults[len(values):]
+        if len(values) > len(func.params) or None in missing:
+            print(f"⚠️  {name}(): attesi {len(func.params)} argomenti, ricevuti {len(values)}")
+            return
         
-        # Esegue cicli for
-        self.execute_for_loops(setup_code, variables)
+        if self._call_depth >= 64:
+            print(f"⚠️  {name}(): troppe chiamate annidate")
+            return
         
-        self.render()
+        # I parametri sono variabili locali; le globali restano condivise
+        local_vars = dict(zip(func.params, values))
+        for param, default in zip(func.params[len(values):], missing):
+            local_vars[param] = self.eval_expr(default, {})
+        self._call_depth += 1
+        try:
+            self.run_block(func.body, local_vars)
+        finally:
+            self._call_depth -= 1
     
-    def execute_for_loops(self, code_text: str, vars_dict: dict):
-        """Esegue cicli for"""
-        lines = code_text.split('\n')
-        i = 0
+    def run_block(self, statements: list, variables: dict) -> bool:
+        """
+        Esegue statement compilati (vedi compile_sketch)
         
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            for_match = re.match(r'for\s*\(\s*int\s+(\w+)\s*=\s*(\d+)\s*;\s*\1\s*<\s*([^;]+)\s*;\s*(.+?)\s*\)\s*{?', line)
+        Args:
+            statements: Corpo compilato
+            variables: Variabili locali (modificate in place)
             
-            if for_match:
-                loop_var = for_match.group(1)
-                start = int(for_match.group(2))
-                end_expr = for_match.group(3).strip()
-                increment_expr = for_match.group(4).strip()
-                
-                end = self.parse_value(end_expr, vars_dict)
-                
-                # Determina incremento
-                increment = 1
-                if '+=' in increment_expr:
-                    inc_match = re.search(r'\+=\s*(\d+)', increment_expr)
-                    if inc_match:
-                        increment = int(inc_match.group(1))
-                elif '=' in increment_expr and '+' in increment_expr:
-                    inc_match = re.search(r'=\s*\w+\s*\+\s*(\d+)', increment_expr)
-                    if inc_match:
-                        increment = int(inc_match.group(1))
-                    else:
-                        inc_match = re.search(r'=\s*\w+\s*\+\s*(\w+)', increment_expr)
-                        if inc_match:
-                            increment = vars_dict.get(inc_match.group(1), 1)
-                
-                # Trova corpo del for
-                if '{' in line:
-                    brace_count = line.count('{') - line.count('}')
-                    i += 1
-                    body_lines = []
-                    
-                    while i < len(lines) and brace_count > 0:
-                        body_lines.append(lines[i])
-                        brace_count += lines[i].count('{') - lines[i].count('}')
-                        i += 1
-                    
-                    if body_lines and body_lines[-1].strip() == '}':
-                        body_lines = body_lines[:-1]
-                    
-                    body = '\n'.join(body_lines)
+        Returns:
+            True se è stato eseguito un return
+        """
+        for stmt in statements:
+            kind = stmt[0]
+            if kind == 'draw':
+                self.run_primitive(stmt, variables)
+            elif kind == 'call':
+                self.call_function(stmt[1], [self.eval_expr(arg, variables) for arg in stmt[2]])
+            elif kind == 'let':
+                _, name, expr, local, integral = stmt
+                # Le assegnazioni a nomi non locali modificano la globale
+                if local or name in variables or name not in self.global_vars:
+                    scope = variables
                 else:
-                    i += 1
-                    body = lines[i] if i < len(lines) else ''
-                    i += 1
+                    scope = self.global_vars
+                self.assign(scope, name, self.eval_expr(expr, variables), integral)
+            elif kind == 'for':
+                _, var, start, cond, end, step, body = stmt
+                start = self.eval_int(start, variables)
+                end = self.eval_int(end, variables)
+                step = self.eval_int(step, variables)
+                if step == 0:
+                    print(f"⚠️  Ciclo for su '{var}' con incremento 0 ignorato")
                     continue
+                if cond == '<=':
+                    end += 1
+                elif cond == '>=':
+                    end -= 1
                 
-                # Esegue loop
-                for loop_val in range(start, end, increment):
-                    local_vars = vars_dict.copy()
-                    local_vars[loop_var] = loop_val
-                    
-                    if 'for' in body and 'int' in body:
-                        self.execute_for_loops(body, local_vars)
-                    else:
-                        for body_line in body.split('\n'):
-                            cmd = body_line.strip()
-                            if cmd and not cmd.startswith('//') and cmd != '}':
-                                self.execute_command(cmd, local_vars)
+                outer = variables.get(var)
+                for value in range(start, end, step):
+                    variables[var] = value
+                    if self.run_block(body, variables):
+                        return True
+                if outer is None:
+                    variables.pop(var, None)
+                else:
+                    variables[var] = outer
+            elif kind == 'if':
+                _, cond, cond_text, body, else_body = stmt
+                try:
+                    taken = bool(eval(cond, self.global_vars, variables))
+                except Exception:
+                    print(f"⚠️  Condizione non valutabile: {cond_text}")
+                    taken = False
+                if self.run_block(body if taken else else_body, variables):
+                    return True
+            elif kind == 'return':
+                return True
+        return False
+    
+    def run_primitive(self, stmt: tuple, variables: dict):
+        """Esegue una primitiva precompilata (vedi _compile_command)"""
+        _, method, name, args = stmt
+        values = []
+        for kind, expr, text in args:
+            if kind == '=':
+                values.append(expr)
+                continue
+            try:
+                value = eval(expr, self.global_vars, variables)
+            except Exception:
+                value = None
+            if kind == 'i':
+                values.append(int(value) if isinstance(value, (int, float)) else 0)
+            elif kind == 'f':
+                values.append(bool(value))
+            elif kind == 's':
+                values.append(text if value is None else str(value))
             else:
-                i += 1
+                values.append(self.to_color(value, text))
+        getattr(self, method)(*values)
+        if self.verbose:
+            # Interi e testi valutati, colori e nomi come scritti nel sorgente
+            shown = [str(v) if kind in 'is' else text
+                     for (kind, _, text), v in zip(args, values) if text is not None]
+            self.log(f"✓ {name}({', '.join(shown)})")
+    
+    def eval_expr(self, expr, variables: dict, default=0):
+        """
+        Valuta un'espressione compilata con _compile_expr
+        
+        I nomi si cercano tra le variabili locali, poi tra le globali dello
+        sketch e infine tra i colori TFT (vedi _SKETCH_NAMES).
+        """
+        try:
+            return eval(expr, self.global_vars, variables)
+        except Exception:
+            return default
+    
+    def eval_int(self, expr, variables: dict) -> int:
+        """Valuta un'espressione compilata come intero (0 se non numerica)"""
+        value = self.eval_expr(expr, variables)
+        return int(value) if isinstance(value, (int, float)) else 0
+    
+    @staticmethod
+    def assign(scope: dict, name: str, value, integral: Optional[bool]):
+        """
+        Scrive una variabile dello sketch
+        
+        Args:
+            integral: True/False dal tipo dichiarato; None per le assegnazioni,
+                che troncano a meno che la variabile non sia già float
+        """
+        if integral is None:
+            integral = not isinstance(scope.get(name), float)
+        if integral and isinstance(value, float):
+            value = int(value)
+        scope[name] = value
+    
+    def to_color(self, value, text: str) -> Tuple[int, int, int]:
+        """Converte il valore di un'espressione (colore TFT, RGB565/888 o nome) in RGB"""
+        if isinstance(value, tuple):
+            return value
+        if isinstance(value, int):
+            return self.parse_color(f"0x{value:X}")
+        return self.parse_color(value if isinstance(value, str) else text)
     
     def execute_command(self, line: str, variables: dict):
         """Esegue singolo comando TFT"""
@@ -485,14 +1467,14 @@ class TFTSimulator:
             match = re.search(r'setRotation\s*\(\s*(\d+)\s*\)', line)
             if match:
                 self.setRotation(int(match.group(1)))
-                print(f"✓ setRotation({match.group(1)})")
+                self.log(f"✓ setRotation({match.group(1)})")
         
         # fillScreen
         elif 'fillScreen' in line:
             match = re.search(r'fillScreen\s*\(\s*(\w+)\s*\)', line)
             if match:
                 self.fillScreen(self.parse_color(match.group(1)))
-                print(f"✓ fillScreen({match.group(1)})")
+                self.log(f"✓ fillScreen({match.group(1)})")
         
         # drawRect
         elif 'drawRect' in line and 'fillRect' not in line and 'RoundRect' not in line:
@@ -504,7 +1486,7 @@ class TFTSimulator:
                 h = self.parse_value(match.group(4), variables)
                 color = self.parse_color(match.group(5))
                 self.drawRect(x, y, w, h, color)
-                print(f"✓ drawRect({x}, {y}, {w}, {h})")
+                self.log(f"✓ drawRect({x}, {y}, {w}, {h})")
         
         # fillRect
         elif 'fillRect' in line and 'RoundRect' not in line:
@@ -516,7 +1498,7 @@ class TFTSimulator:
                 h = self.parse_value(match.group(4), variables)
                 color = self.parse_color(match.group(5))
                 self.fillRect(x, y, w, h, color)
-                print(f"✓ fillRect({x}, {y}, {w}, {h})")
+                self.log(f"✓ fillRect({x}, {y}, {w}, {h})")
         
         # fillRoundRect
         elif 'fillRoundRect' in line:
@@ -529,7 +1511,7 @@ class TFTSimulator:
                 r = self.parse_value(match.group(5), variables)
                 color = self.parse_color(match.group(6))
                 self.fillRoundRect(x, y, w, h, r, color)
-                print(f"✓ fillRoundRect({x}, {y}, {w}, {h}, {r})")
+                self.log(f"✓ fillRoundRect({x}, {y}, {w}, {h}, {r})")
         
         # drawRoundRect
         elif 'drawRoundRect' in line:
@@ -542,7 +1524,7 @@ class TFTSimulator:
                 r = self.parse_value(match.group(5), variables)
                 color = self.parse_color(match.group(6))
                 self.drawRoundRect(x, y, w, h, r, color)
-                print(f"✓ drawRoundRect({x}, {y}, {w}, {h}, {r})")
+                self.log(f"✓ drawRoundRect({x}, {y}, {w}, {h}, {r})")
         
         # drawCircle
         elif 'drawCircle' in line and 'fillCircle' not in line:
@@ -553,7 +1535,7 @@ class TFTSimulator:
                 r = self.parse_value(match.group(3), variables)
                 color = self.parse_color(match.group(4))
                 self.drawCircle(x, y, r, color)
-                print(f"✓ drawCircle({x}, {y}, {r})")
+                self.log(f"✓ drawCircle({x}, {y}, {r})")
         
         # fillCircle
         elif 'fillCircle' in line:
@@ -564,7 +1546,7 @@ class TFTSimulator:
                 r = self.parse_value(match.group(3), variables)
                 color = self.parse_color(match.group(4))
                 self.fillCircle(x, y, r, color)
-                print(f"✓ fillCircle({x}, {y}, {r})")
+                self.log(f"✓ fillCircle({x}, {y}, {r})")
         
         # drawLine
         elif 'drawLine' in line:
@@ -576,7 +1558,7 @@ class TFTSimulator:
                 y1 = self.parse_value(match.group(4), variables)
                 color = self.parse_color(match.group(5))
                 self.drawLine(x0, y0, x1, y1, color)
-                print(f"✓ drawLine({x0}, {y0}, {x1}, {y1})")
+                self.log(f"✓ drawLine({x0}, {y0}, {x1}, {y1})")
         
         # drawTriangle
         elif 'drawTriangle' in line and 'fillTriangle' not in line:
@@ -590,7 +1572,7 @@ class TFTSimulator:
                 y2 = self.parse_value(match.group(6), variables)
                 color = self.parse_color(match.group(7))
                 self.drawTriangle(x0, y0, x1, y1, x2, y2, color)
-                print(f"✓ drawTriangle({x0}, {y0}, {x1}, {y1}, {x2}, {y2})")
+                self.log(f"✓ drawTriangle({x0}, {y0}, {x1}, {y1}, {x2}, {y2})")
         
         # fillTriangle
         elif 'fillTriangle' in line:
@@ -604,7 +1586,55 @@ class TFTSimulator:
                 y2 = self.parse_value(match.group(6), variables)
                 color = self.parse_color(match.group(7))
                 self.fillTriangle(x0, y0, x1, y1, x2, y2, color)
-                print(f"✓ fillTriangle({x0}, {y0}, {x1}, {y1}, {x2}, {y2})")
+                self.log(f"✓ fillTriangle({x0}, {y0}, {x1}, {y1}, {x2}, {y2})")
+        
+        # drawArc / drawSmoothArc
+        elif 'drawArc' in line or 'drawSmoothArc' in line:
+            match = re.search(r'(drawArc|drawSmoothArc)\s*\(\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,\)]+)(?:,\s*(\w+))?\s*\)', line)
+            if match:
+                x, y, r, ir, start, end = [self.parse_value(match.group(i), variables) for i in range(2, 8)]
+                fg = self.parse_color(match.group(8))
+                bg = self.parse_bg_color(match.group(9))
+                if match.group(1) == 'drawArc':
+                    smooth = match.group(10) != 'false'
+                    self.drawArc(x, y, r, ir, start, end, fg, bg, smooth)
+                else:
+                    round_ends = match.group(10) == 'true'
+                    self.drawSmoothArc(x, y, r, ir, start, end, fg, bg, round_ends)
+                self.log(f"✓ {match.group(1)}({x}, {y}, {r}, {ir}, {start}, {end})")
+        
+        # drawWideLine
+        elif 'drawWideLine' in line:
+            match = re.search(r'drawWideLine\s*\(\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,\)]+)(?:,\s*([^\)]+))?\s*\)', line)
+            if match:
+                x0, y0, x1, y1, wd = [self.parse_value(match.group(i), variables) for i in range(1, 6)]
+                fg = self.parse_color(match.group(6))
+                bg = self.parse_bg_color(match.group(7))
+                self.drawWideLine(x0, y0, x1, y1, wd, fg, bg)
+                self.log(f"✓ drawWideLine({x0}, {y0}, {x1}, {y1}, {wd})")
+        
+        # fillSmoothCircle
+        elif 'fillSmoothCircle' in line:
+            match = re.search(r'fillSmoothCircle\s*\(\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,\)]+)(?:,\s*([^\)]+))?\s*\)', line)
+            if match:
+                x = self.parse_value(match.group(1), variables)
+                y = self.parse_value(match.group(2), variables)
+                r = self.parse_value(match.group(3), variables)
+                color = self.parse_color(match.group(4))
+                bg = self.parse_bg_color(match.group(5))
+                self.fillSmoothCircle(x, y, r, color, bg)
+                self.log(f"✓ fillSmoothCircle({x}, {y}, {r})")
+        
+        # drawSmoothRoundRect
+        elif 'drawSmoothRoundRect' in line:
+            match = re.search(r'drawSmoothRoundRect\s*\(\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,]+),\s*([^,\)]+)(?:,\s*([^,\)]+))?(?:,\s*([^,\)]+))?\s*\)', line)
+            if match:
+                x, y, r, ir, w, h = [self.parse_value(match.group(i), variables) for i in range(1, 7)]
+                fg = self.parse_color(match.group(7))
+                bg = self.parse_bg_color(match.group(8))
+                quadrants = self.parse_value(match.group(9), variables) if match.group(9) else 0xF
+                self.drawSmoothRoundRect(x, y, r, ir, w, h, fg, bg, quadrants)
+                self.log(f"✓ drawSmoothRoundRect({x}, {y}, {r}, {ir}, {w}, {h})")
         
         # drawBitmap
         elif 'drawBitmap' in line:
@@ -617,7 +1647,7 @@ class TFTSimulator:
                 h = self.parse_value(match.group(5), variables)
                 color = self.parse_color(match.group(6))
                 self.drawBitmap(x, y, bitmap_name, w, h, color)
-                print(f"✓ drawBitmap({x}, {y}, {bitmap_name}, {w}, {h})")
+                self.log(f"✓ drawBitmap({x}, {y}, {bitmap_name}, {w}, {h})")
         
         # setCursor
         elif 'setCursor' in line:
@@ -627,7 +1657,7 @@ class TFTSimulator:
                 y = self.parse_value(match.group(2), variables)
                 font = int(match.group(3)) if match.group(3) else None
                 self.setCursor(x, y, font)
-                print(f"✓ setCursor({x}, {y}{f', {font}' if font else ''})")
+                self.log(f"✓ setCursor({x}, {y}{f', {font}' if font else ''})")
         
         # setTextColor
         elif 'setTextColor' in line:
@@ -645,10 +1675,10 @@ class TFTSimulator:
                         g = (color_val >> 8) & 0xFF
                         b = color_val & 0xFF
                     self.setTextColor((r, g, b))
-                    print(f"✓ setTextColor({color_str}) -> RGB({r},{g},{b})")
+                    self.log(f"✓ setTextColor({color_str}) -> RGB({r},{g},{b})")
                 else:
                     self.setTextColor(color_str)
-                    print(f"✓ setTextColor({color_str})")
+                    self.log(f"✓ setTextColor({color_str})")
         
         # setTextFont
         elif 'setTextFont' in line:
@@ -656,7 +1686,7 @@ class TFTSimulator:
             if match:
                 font_num = int(match.group(1))
                 self.setTextFont(font_num)
-                print(f"✓ setTextFont({font_num})")
+                self.log(f"✓ setTextFont({font_num})")
         
         # setTextSize
         elif 'setTextSize' in line:
@@ -664,7 +1694,7 @@ class TFTSimulator:
             if match:
                 size = int(match.group(1))
                 self.setTextSize(size)
-                print(f"✓ setTextSize({size})")
+                self.log(f"✓ setTextSize({size})")
         
         # print / println
         elif 'tft.println' in line or 'tft.print(' in line:
@@ -675,7 +1705,7 @@ class TFTSimulator:
                     self.println_text(text)
                 else:
                     self.print_text(text)
-                print(f"✓ print('{text}')")
+                self.log(f"✓ print('{text}')")
         
         # drawString
         elif 'drawString' in line:
@@ -686,45 +1716,720 @@ class TFTSimulator:
                 y = self.parse_value(match.group(3), variables)
                 font = int(match.group(4)) if match.group(4) else None
                 self.drawString(text, x, y, font)
-                print(f"✓ drawString('{text}', {x}, {y})")
+                self.log(f"✓ drawString('{text}', {x}, {y})")
+
+# ===== FRAMEBUFFER STREAMING =====
+
+STREAM_MAGIC = b'TFTF'
+STREAM_HEADER = struct.Struct('<4sHHHH')  # magic, width, height, flags, n_tile
+STREAM_TILE_HEADER = struct.Struct('<HHHHI')  # x, y, w, h, lunghezza payload zlib
+STREAM_FLAG_KEYFRAME = 0x01
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_MAX_FRAME = 4096          # Il client invia solo frame di controllo (max 125 byte)
+HTTP_HEADER_TIMEOUT = 10.0   # Secondi per ricevere l'header della richiesta HTTP
+
+# Client HTML minimale servito su GET /
+STREAM_CLIENT_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>TFT_eSPI Simulator (Stream)</title>
+<style>
+  body { margin: 0; background: #222; display: flex; align-items: center;
+         justify-content: center; height: 100vh; }
+  canvas { image-rendering: pixelated; }
+</style>
+</head>
+<body>
+<canvas id="tft"></canvas>
+<script>
+const canvas = document.getElementById('tft');
+const ctx = canvas.getContext('2d');
+let queue = Promise.resolve();
+
+async function inflate(bytes) {
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+async function applyFrame(buf) {
+  const view = new DataView(buf);
+  const w = view.getUint16(4, true), h = view.getUint16(6, true);
+  const n = view.getUint16(10, true);
+  if (canvas.width !== w || canvas.height !== h) {
+    canvas.width = w;
+    canvas.height = h;
+  }
+  let off = 12;
+  for (let t = 0; t < n; t++) {
+    const x = view.getUint16(off, true), y = view.getUint16(off + 2, true);
+    const tw = view.getUint16(off + 4, true), th = view.getUint16(off + 6, true);
+    const len = view.getUint32(off + 8, true);
+    off += 12;
+    const rgb = await inflate(new Uint8Array(buf, off, len));
+    off += len;
+    const img = ctx.createImageData(tw, th);
+    for (let i = 0, j = 0; i < rgb.length; i += 3, j += 4) {
+      img.data[j] = rgb[i];
+      img.data[j + 1] = rgb[i + 1];
+      img.data[j + 2] = rgb[i + 2];
+      img.data[j + 3] = 255;
+    }
+    ctx.putImageData(img, x, y);
+  }
+}
+
+function connect() {
+  const ws = new WebSocket(`ws://${location.host}/ws`);
+  ws.binaryType = 'arraybuffer';
+  ws.onmessage = (ev) => { queue = queue.then(() => applyFrame(ev.data)); };
+  ws.onclose = () => setTimeout(connect, 1000);
+}
+connect();
+</script>
+</body>
+</html>
+"""
+
+
+class _StreamClient:
+    """Stato di un viewer connesso"""
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.dirty = set()      # Indici dei tile cambiati dall'ultimo invio
+        self.keyframe = True    # Il prossimo invio deve contenere tutti i tile
+        self.wakeup = asyncio.Event()
+
+
+class FrameStreamer:
+    """
+    Server asyncio che trasmette la surface del simulatore via WebSocket
+    
+    Lo schermo è diviso in tile: ad ogni frame vengono compressi (zlib) solo
+    i tile cambiati, una sola volta per tutti i viewer. Ogni viewer accumula
+    gli indici dei tile da inviare: se è lento i frame intermedi vengono
+    scartati e riceve solo il contenuto più recente di ogni tile.
+    
+    Esempio:
+        streamer = FrameStreamer(port=8765)
+        streamer.start()
+        sim.streamer = streamer
+        # Apri http://127.0.0.1:8765/ nel browser
+    """
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765,
+                 tile_size: int = 32, compress_level: int = 1):
+        self.host = host
+        self.port = port
+        self.tile_size = tile_size
+        self.compress_level = compress_level
+        
+        self.frame_size = (0, 0)
+        self.tile_rects = []    # [(x, y, w, h)]
+        self.tile_raw = []      # Pixel RGB dell'ultimo frame per ogni tile
+        self.tile_data = []     # Header + payload compresso per ogni tile
+        self.clients = set()
+        
+        self.loop = None
+        self.server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+        
+        # Ultimo frame non ancora codificato: se la codifica è più lenta del
+        # rendering i frame intermedi vengono sovrascritti, non accodati
+        self._pending = None
+        self._pending_lock = threading.Lock()
+    
+    # --- Ciclo di vita (chiamato dal thread pygame) ---
+    
+    def start(self):
+        """Avvia il server in un thread in background"""
+        self._thread = threading.Thread(target=self._run, name='tft-stream', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+    
+    def stop(self):
+        """Ferma il server e chiude le connessioni"""
+        if self.loop is not None and self._thread is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=2)
+    
+    def publish(self, surface: pygame.Surface):
+        """Invia un nuovo frame ai viewer (thread-safe)"""
+        if self.loop is None or not self.loop.is_running():
+            return
+        to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+        frame = (to_bytes(surface, 'RGB'), surface.get_size())
+        with self._pending_lock:
+            scheduled = self._pending is not None
+            self._pending = frame
+        if not scheduled:
+            self.loop.call_soon_threadsafe(self._ingest_pending)
+    
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.host, self.port))
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            # Chiudere i socket fa terminare le letture dei viewer senza cancellarle
+            for client in list(self.clients):
+                client.writer.close()
+            self.loop.run_until_complete(asyncio.sleep(0.1))
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+    
+    # --- Codifica (thread asyncio) ---
+    
+    def _ingest_pending(self):
+        """Codifica il frame più recente pubblicato"""
+        with self._pending_lock:
+            frame, self._pending = self._pending, None
+        if frame is not None:
+            self._ingest(*frame)
+    
+    def _ingest(self, data: bytes, size: Tuple[int, int]):
+        """Confronta il frame con il precedente e codifica i tile cambiati"""
+        w, h = size
+        ts = self.tile_size
+        stride = w * 3
+        
+        if size != self.frame_size:
+            # Nuova risoluzione (es. setRotation): tutti i viewer ripartono da un keyframe
+            self.frame_size = size
+            self.tile_rects = [(x, y, min(ts, w - x), min(ts, h - y))
+                               for y in range(0, h, ts) for x in range(0, w, ts)]
+            self.tile_raw = [None] * len(self.tile_rects)
+            self.tile_data = [None] * len(self.tile_rects)
+            for client in self.clients:
+                client.dirty.clear()
+                client.keyframe = True
+        
+        changed = []
+        for i, (x, y, tw, th) in enumerate(self.tile_rects):
+            start = y * stride + x * 3
+            row_len = tw * 3
+            raw = b''.join(data[start + row * stride:start + row * stride + row_len]
+                           for row in range(th))
+            if raw == self.tile_raw[i]:
+                continue
+            self.tile_raw[i] = raw
+            payload = zlib.compress(raw, self.compress_level)
+            self.tile_data[i] = STREAM_TILE_HEADER.pack(x, y, tw, th, len(payload)) + payload
+            changed.append(i)
+        
+        if not changed:
+            return
+        for client in self.clients:
+            client.dirty.update(changed)
+            client.wakeup.set()
+    
+    def _build_message(self, client: _StreamClient) -> bytes:
+        """Prepara il messaggio con i tile ancora da inviare al viewer"""
+        if client.keyframe:
+            indices = [i for i, tile in enumerate(self.tile_data) if tile is not None]
+            flags = STREAM_FLAG_KEYFRAME
+            client.keyframe = False
+        else:
+            indices = sorted(client.dirty)
+            flags = 0
+        client.dirty = set()
+        if not indices:
+            return b''
+        w, h = self.frame_size
+        header = STREAM_HEADER.pack(STREAM_MAGIC, w, h, flags, len(indices))
+        return header + b''.join(self.tile_data[i] for i in indices)
+    
+    # --- Rete (thread asyncio) ---
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        """Serve il client HTML o effettua l'upgrade a WebSocket"""
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HTTP_HEADER_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        
+        lines = request.decode('latin-1').split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        
+        if headers.get('upgrade', '').lower() == 'websocket' and 'sec-websocket-key' in headers:
+            await self._serve_websocket(reader, writer, headers['sec-websocket-key'])
+        else:
+            body = STREAM_CLIENT_HTML.encode('utf-8')
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/html; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\n'
+                         b'Connection: close\r\n\r\n' + body)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+    
+    async def _serve_websocket(self, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter, key: str):
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest())
+        writer.write(b'HTTP/1.1 101 Switching Protocols\r\n'
+                     b'Upgrade: websocket\r\n'
+                     b'Connection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+        # Buffer piccolo: drain() blocca presto e i frame intermedi vengono scartati
+        writer.transport.set_write_buffer_limits(high=256 * 1024)
+        
+        client = _StreamClient(writer)
+        self.clients.add(client)
+        if any(tile is not None for tile in self.tile_data):
+            client.wakeup.set()
+        sender = asyncio.ensure_future(self._client_sender(client))
+        peer = writer.get_extra_info('peername')
+        print(f"✓ Viewer connesso: {peer}")
+        
+        try:
+            await self._read_until_close(reader, writer)
+        finally:
+            sender.cancel()
+            self.clients.discard(client)
+            writer.close()
+            print(f"✓ Viewer disconnesso: {peer}")
+    
+    async def _client_sender(self, client: _StreamClient):
+        """Invia i tile aggiornati al viewer non appena il socket è libero"""
+        try:
+            while True:
+                await client.wakeup.wait()
+                client.wakeup.clear()
+                message = self._build_message(client)
+                if message:
+                    client.writer.write(self._ws_frame(0x2, message))
+                    await client.writer.drain()
+        except ConnectionError:
+            pass
+    
+    async def _read_until_close(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter):
+        """Legge (e scarta) i frame dal browser fino alla chiusura"""
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                opcode = head[0] & 0x0F
+                length = head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack('>H', await reader.readexactly(2))[0]
+                elif length == 127:
+                    length = struct.unpack('>Q', await reader.readexactly(8))[0]
+                if length > WS_MAX_FRAME:
+                    # Frame troppo grande: chiude con 1009 (message too big)
+                    print(f"⚠️  Frame WebSocket di {length} byte rifiutato")
+                    writer.write(self._ws_frame(0x8, struct.pack('>H', 1009)))
+                    return
+                mask = await reader.readexactly(4) if head[1] & 0x80 else None
+                payload = await reader.readexactly(length)
+                if mask:
+                    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+                
+                if opcode == 0x8:  # close
+                    writer.write(self._ws_frame(0x8, payload[:2]))
+                    return
+                if opcode == 0x9:  # ping
+                    writer.write(self._ws_frame(0xA, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+    
+    @staticmethod
+    def _ws_frame(opcode: int, payload: bytes) -> bytes:
+        """Costruisce un frame WebSocket server->client (non mascherato)"""
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 0x10000:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        return header + payload
+
+
+# ===== LIVE COMMAND INGESTION =====
+
+@lru_cache(maxsize=None)
+def rgb565_to_rgb(value: int) -> Tuple[int, int, int]:
+    """Converte un colore RGB565 in tupla RGB"""
+    r = ((value >> 11) & 0x1F) * 255 // 31
+    g = ((value >> 5) & 0x3F) * 255 // 63
+    b = (value & 0x1F) * 255 // 31
+    return (r, g, b)
+
+
+# Protocollo binario: SYNC, opcode, argomenti little-endian (int16 per le
+# coordinate, uint16 RGB565 per i colori). Gli opcode con testo terminano con
+# la lunghezza in byte seguita dal testo UTF-8.
+INGEST_SYNC = 0xA5
+INGEST_FLAG_MAIN = 0x01  # smooth / round_ends degli archi
+INGEST_FLAG_BLEND = 0x02  # ignora bg e sfuma con i pixel dello schermo
+
+
+def _ingest_bg(color: int, flags: int) -> Optional[Tuple[int, int, int]]:
+    """Colore di sfondo di un arco binario (None = sfuma sullo schermo)"""
+    return None if flags & INGEST_FLAG_BLEND else rgb565_to_rgb(color)
+
+# {opcode: (formato argomenti, ha_testo, handler(sim, args))}
+INGEST_OPCODES = {
+    0x01: (struct.Struct('<B'), False, lambda sim, a: sim.setRotation(a[0])),
+    0x02: (struct.Struct('<H'), False, lambda sim, a: sim.fillScreen(rgb565_to_rgb(a[0]))),
+    0x03: (struct.Struct('<hhhhH'), False,
+           lambda sim, a: sim.drawRect(a[0], a[1], a[2], a[3], rgb565_to_rgb(a[4]))),
+    0x04: (struct.Struct('<hhhhH'), False,
+           lambda sim, a: sim.fillRect(a[0], a[1], a[2], a[3], rgb565_to_rgb(a[4]))),
+    0x05: (struct.Struct('<hhhhhH'), False,
+           lambda sim, a: sim.drawRoundRect(a[0], a[1], a[2], a[3], a[4], rgb565_to_rgb(a[5]))),
+    0x06: (struct.Struct('<hhhhhH'), False,
+           lambda sim, a: sim.fillRoundRect(a[0], a[1], a[2], a[3], a[4], rgb565_to_rgb(a[5]))),
+    0x07: (struct.Struct('<hhhH'), False,
+           lambda sim, a: sim.drawCircle(a[0], a[1], a[2], rgb565_to_rgb(a[3]))),
+    0x08: (struct.Struct('<hhhH'), False,
+           lambda sim, a: sim.fillCircle(a[0], a[1], a[2], rgb565_to_rgb(a[3]))),
+    0x09: (struct.Struct('<hhhhH'), False,
+           lambda sim, a: sim.drawLine(a[0], a[1], a[2], a[3], rgb565_to_rgb(a[4]))),
+    0x0A: (struct.Struct('<hhhhhhH'), False,
+           lambda sim, a: sim.drawTriangle(a[0], a[1], a[2], a[3], a[4], a[5], rgb565_to_rgb(a[6]))),
+    0x0B: (struct.Struct('<hhhhhhH'), False,
+           lambda sim, a: sim.fillTriangle(a[0], a[1], a[2], a[3], a[4], a[5], rgb565_to_rgb(a[6]))),
+    0x0C: (struct.Struct('<hhB'), False,  # font 0 = invariato
+           lambda sim, a: sim.setCursor(a[0], a[1], a[2] or None)),
+    0x0D: (struct.Struct('<H'), False, lambda sim, a: sim.setTextColor(rgb565_to_rgb(a[0]))),
+    0x0E: (struct.Struct('<B'), False, lambda sim, a: sim.setTextFont(a[0])),
+    0x0F: (struct.Struct('<B'), False, lambda sim, a: sim.setTextSize(a[0])),
+    0x10: (struct.Struct('<H'), True, lambda sim, a: sim.print_text(a[0])),
+    0x11: (struct.Struct('<H'), True, lambda sim, a: sim.println_text(a[0])),
+    0x12: (struct.Struct('<hhBH'), True,  # font 0 = corrente
+           lambda sim, a: sim.drawString(a[3], a[0], a[1], a[2] or None)),
+    0x13: (struct.Struct('<hhhhHB'), True,  # testo = nome della bitmap
+           lambda sim, a: sim.drawBitmap(a[0], a[1], a[5], a[2], a[3], rgb565_to_rgb(a[4]))),
+    0x14: (struct.Struct('<hhhhhhHHB'), False,  # flag: bit 0 smooth, bit 1 sfuma sullo schermo
+           lambda sim, a: sim.drawArc(a[0], a[1], a[2], a[3], a[4], a[5], rgb565_to_rgb(a[6]),
+                                      _ingest_bg(a[7], a[8]), bool(a[8] & INGEST_FLAG_MAIN))),
+    0x15: (struct.Struct('<hhhhhhHHB'), False,  # flag: bit 0 round_ends, bit 1 sfuma sullo schermo
+           lambda sim, a: sim.drawSmoothArc(a[0], a[1], a[2], a[3], a[4], a[5], rgb565_to_rgb(a[6]),
+                                            _ingest_bg(a[7], a[8]), bool(a[8] & INGEST_FLAG_MAIN))),
+    0x16: (struct.Struct('<hhhhhH'), False,
+           lambda sim, a: sim.drawWideLine(a[0], a[1], a[2], a[3], a[4], rgb565_to_rgb(a[5]))),
+    0x17: (struct.Struct('<hhhH'), False,
+           lambda sim, a: sim.fillSmoothCircle(a[0], a[1], a[2], rgb565_to_rgb(a[3]))),
+    0x18: (struct.Struct('<hhhhhhH'), False,
+           lambda sim, a: sim.drawSmoothRoundRect(a[0], a[1], a[2], a[3], a[4], a[5],
+                                                  rgb565_to_rgb(a[6]))),
+}
+
+
+class CommandIngestor:
+    """
+    Esegue comandi di disegno ricevuti da stdin, named pipe o pty
+    
+    Accetta, anche mescolati nello stesso stream:
+    - righe di testo con la sintassi degli sketch (es. "tft.fillRect(0, 0, 10, 10, TFT_RED);")
+    - frame binari che iniziano con INGEST_SYNC (vedi INGEST_OPCODES)
+    
+    I dati vengono decodificati a blocchi e il display viene presentato al
+    massimo una volta per frame, indipendentemente da quanti comandi arrivano.
+    
+    Esempio:
+        ingestor = CommandIngestor(sim, fps=60)
+        asyncio.run(ingestor.run('-'))  # '-' = stdin, 'pty' = nuovo pty, altrimenti un percorso
+    """
+    
+    def __init__(self, sim: TFTSimulator, fps: int = 60, chunk_size: int = 1 << 16):
+        self.sim = sim
+        self.fps = fps
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.command_count = 0
+        self.dirty = False
+        self.running = False
+    
+    def feed(self, data: bytes) -> int:
+        """
+        Decodifica ed esegue tutti i comandi completi presenti nel buffer
+        
+        Returns:
+            Numero di comandi eseguiti (i dati incompleti restano nel buffer)
+        """
+        buf = self.buffer
+        buf += data
+        sim = self.sim
+        opcodes = INGEST_OPCODES
+        end = len(buf)
+        pos = 0
+        executed = 0
+        
+        while pos < end:
+            if buf[pos] == INGEST_SYNC:
+                if pos + 2 > end:
+                    break
+                opcode = buf[pos + 1]
+                spec = opcodes.get(opcode)
+                if spec is None:
+                    print(f"⚠️  Opcode sconosciuto: 0x{opcode:02X}")
+                    pos = self._resync(buf, pos + 1)
+                    continue
+                fmt, has_text, handler = spec
+                next_pos = pos + 2 + fmt.size
+                if next_pos > end:
+                    break
+                args = fmt.unpack_from(buf, pos + 2)
+                if has_text:
+                    text_end = next_pos + args[-1]
+                    if text_end > end:
+                        break
+                    text = buf[next_pos:text_end].decode('utf-8', 'replace')
+                    args = args[:-1] + (text,)
+                    next_pos = text_end
+                pos = next_pos
+                try:
+                    handler(sim, args)
+                except Exception as e:
+                    print(f"⚠️  Errore comando binario 0x{opcode:02X}: {e}")
+                    continue
+            else:
+                newline = buf.find(b'\n', pos)
+                if newline < 0:
+                    break
+                line = buf[pos:newline].decode('utf-8', 'replace').strip()
+                pos = newline + 1
+                if not line or line.startswith('//'):
+                    continue
+                try:
+                    self.execute_line(line)
+                except Exception as e:
+                    print(f"⚠️  Errore comando '{line}': {e}")
+                    continue
+            executed += 1
+        
+        del buf[:pos]
+        if executed:
+            self.command_count += executed
+            self.dirty = True
+        return executed
+    
+    @staticmethod
+    def _resync(buf: bytearray, start: int) -> int:
+        """Posizione del prossimo frame binario o della prossima riga di testo"""
+        candidates = [buf.find(INGEST_SYNC, start)]
+        newline = buf.find(b'\n', start)
+        if newline >= 0:
+            candidates.append(newline + 1)
+        candidates = [c for c in candidates if c >= 0]
+        return min(candidates) if candidates else len(buf)
+    
+    def execute_line(self, line: str):
+        """Esegue una riga di testo, compilata come il corpo di una funzione dello sketch"""
+        statements, warnings = _compile_line(line, self.sim.sketch)
+        for warning in warnings:
+            print(f"⚠️  {warning}")
+        # Le dichiarazioni delle righe di testo diventano globali dello sketch
+        self.sim.run_block(statements, self.sim.global_vars)
+    
+    async def run(self, source: str):
+        """Legge da source finché la finestra resta aperta"""
+        self.running = True
+        read, cleanup = await self._open_source(source)
+        reader = asyncio.ensure_future(self._read_loop(read))
+        reader.add_done_callback(self._reader_done)
+        try:
+            await self._present_loop()
+        finally:
+            self.running = False
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            cleanup()
+    
+    @staticmethod
+    def _reader_done(task: asyncio.Task):
+        """Segnala un lettore terminato per errore (non per EOF o chiusura)"""
+        if not task.cancelled() and task.exception() is not None:
+            print(f"❌ Lettura dei comandi interrotta: {task.exception()!r}")
+    
+    async def _read_loop(self, read):
+        """Legge e decodifica blocchi di dati fino all'EOF"""
+        while True:
+            data = await read(self.chunk_size)
+            if not data:
+                break
+            self.feed(data)
+            # Lascia spazio al present anche se il produttore non si ferma mai
+            await asyncio.sleep(0)
+        if self.buffer.strip():
+            self.feed(b'\n')  # Ultima riga senza a capo
+        print(f"✓ Stream terminato: {self.command_count} comandi ricevuti")
+    
+    async def _present_loop(self):
+        """Gestisce gli eventi pygame e presenta al massimo un frame per tick"""
+        interval = 1.0 / self.fps
+        while self.running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    self.running = False
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    self.running = False
+            if self.dirty:
+                self.dirty = False
+                self.sim.render()
+            await asyncio.sleep(interval)
+    
+    async def _open_source(self, source: str):
+        """Apre stdin, un nuovo pty o una named pipe e restituisce (read, cleanup)"""
+        loop = asyncio.get_running_loop()
+        extra_fds = []
+        
+        if source == '-':
+            pipe = open(sys.stdin.fileno(), 'rb', buffering=0, closefd=False)
+            # Il flag O_NONBLOCK è condiviso con la shell (es. stdin su terminale):
+            # va ripristinato alla chiusura
+            was_blocking = os.get_blocking(pipe.fileno())
+        elif source == 'pty':
+            import tty
+            master, slave = os.openpty()
+            tty.setraw(slave)  # Nessuna eco né traduzione dei byte binari
+            extra_fds.append(slave)
+            pipe = open(master, 'rb', buffering=0)
+            print(f"📡 In ascolto su pty: {os.ttyname(slave)}")
+        else:
+            pipe = open(os.open(source, os.O_RDONLY | os.O_NONBLOCK), 'rb', buffering=0)
+            if stat.S_ISFIFO(os.fstat(pipe.fileno()).st_mode):
+                # Un writer fittizio evita l'EOF quando il produttore si riconnette
+                extra_fds.append(os.open(source, os.O_WRONLY | os.O_NONBLOCK))
+            print(f"📡 In ascolto su: {source}")
+        
+        mode = os.fstat(pipe.fileno()).st_mode
+        if not (stat.S_ISFIFO(mode) or stat.S_ISCHR(mode) or stat.S_ISSOCK(mode)):
+            # File regolare (es. "--ingest - < comandi.bin"): lettura in un thread
+            os.set_blocking(pipe.fileno(), True)
+            
+            async def read_file(n):
+                return await loop.run_in_executor(None, pipe.read, n)
+            
+            def close_file():
+                if source == '-':
+                    os.set_blocking(pipe.fileno(), was_blocking)
+                else:
+                    pipe.close()
+            
+            return read_file, close_file
+        
+        reader = asyncio.StreamReader(limit=self.chunk_size * 4)
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        
+        def close_pipe():
+            transport.close()
+            if source == '-':
+                os.set_blocking(pipe.fileno(), was_blocking)
+            for fd in extra_fds:
+                os.close(fd)
+        
+        return reader.read, close_pipe
+
 
 def main():
-    if len(sys.argv) < 2:
-        print("Uso: python tft_simulator_interactive.py <file.ino>")
-        print("\nEsempio: python tft_simulator_interactive.py main_interface.txt")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="TFT_eSPI Display Simulator (Interactive)",
+        epilog="Esempio: python tft_simulator_interactive_v2.py main_interface.txt")
+    parser.add_argument('filename', nargs='?', help="Sketch Arduino (.ino/.txt) da eseguire")
+    parser.add_argument('--ingest', metavar='SOURCE',
+                        help="Esegue comandi live da SOURCE: '-' (stdin), 'pty' o una named pipe")
+    parser.add_argument('--fps', type=int, default=60,
+                        help="Frame al secondo in modalità --ingest (default: 60)")
+    parser.add_argument('--serve', action='store_true',
+                        help="Trasmette il display via WebSocket (client HTML su http://HOST:PORT/)")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Indirizzo del server di streaming (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8765,
+                        help="Porta del server di streaming (default: 8765)")
+    args = parser.parse_args()
     
-    filename = sys.argv[1]
+    if args.filename is None and args.ingest is None:
+        parser.error("specificare uno sketch o --ingest")
     
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            code = f.read()
-    except FileNotFoundError:
-        print(f"❌ File '{filename}' non trovato")
-        sys.exit(1)
+    filename = args.filename
+    code = None
+    if filename is not None:
+        try:
+            with open(filename, 'r', encoding='utf-8') as f:
+                code = f.read()
+        except FileNotFoundError:
+            print(f"❌ File '{filename}' non trovato")
+            sys.exit(1)
     
     print(f"\n🖥️  TFT_eSPI Simulator (Interactive)")
-    print(f"📁 Caricamento: {filename}\n")
+    if filename is not None:
+        print(f"📁 Caricamento: {filename}\n")
     
     sim = TFTSimulator()
-    sim.parse_and_execute(code)
     
-    print(f"\n✅ Rendering completato!")
-    print(f"📐 Dimensioni: {sim.width}x{sim.height} (Rotazione: {sim.rotation})")
+    streamer = None
+    if args.serve:
+        streamer = FrameStreamer(args.host, args.port)
+        try:
+            streamer.start()
+        except OSError as e:
+            print(f"❌ Impossibile avviare lo streaming su {args.host}:{args.port}: {e}")
+            sys.exit(1)
+        sim.streamer = streamer
+        print(f"📡 Streaming attivo: http://{args.host}:{args.port}/\n")
+    
+    if code is not None:
+        sim.parse_and_execute(code)
+        print(f"\n✅ Rendering completato!")
+        print(f"📐 Dimensioni: {sim.width}x{sim.height} (Rotazione: {sim.rotation})")
+    
     print(f"\n🎮 Premi ESC o chiudi la finestra per uscire\n")
     
-    # Loop principale
-    running = True
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
+    if args.ingest is not None:
+        # Il loop asyncio gestisce sia la lettura dei comandi che gli eventi pygame
+        sim.verbose = False
+        sim.render()
+        try:
+            asyncio.run(CommandIngestor(sim, fps=args.fps).run(args.ingest))
+        except OSError as e:
+            print(f"❌ Impossibile aprire '{args.ingest}': {e}")
+        except KeyboardInterrupt:
+            pass
+    else:
+        # Loop principale
+        running = True
+        while running:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
                     running = False
-        
-        sim.clock.tick(60)
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        running = False
+            
+            sim.clock.tick(60)
     
+    if streamer is not None:
+        streamer.stop()
     pygame.quit()
 
 if __name__ == "__main__":